@@ -4,109 +4,55 @@ import plotly.express as px
 import plotly.graph_objects as go
 import requests
 import json
-import io # To handle in-memory CSV data for insights
+import io # To read the uploaded CSV bytes
+import hashlib
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- Configuration ---
 # Set your Gemini API Key here. Get one from https://makersuite.google.com/
-# For security, consider using Streamlit Secrets for deployment:
-# st.secrets["GEMINI_API_KEY"]
+# For security, use Streamlit Secrets for deployment: a GEMINI_API_KEY entry
+# in .streamlit/secrets.toml (or the app's secrets settings) takes precedence.
 GEMINI_API_KEY = "YOUR_GEMINI_API_KEY" # Replace with your actual key
-
-# --- Page Configuration ---
-st.set_page_config(
-    page_title="Interactive Media Intelligence Dashboard",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
-# --- Custom Functions ---
-
-def normalize_column_name(name):
-    """Normalizes column names by converting to lowercase and removing non-alphanumeric characters."""
-    return name.lower().replace(' ', '').replace('-', '').replace('_', '')
-
-def clean_data(df):
-    """
-    Cleans the input DataFrame:
-    - Converts 'date' column to datetime.
-    - Fills missing 'engagements' with 0.
-    - Normalizes all column names.
-    - Filters out rows with invalid dates.
-    """
-    st.subheader("2. Data Cleaning Summary")
-    st.markdown("""
-    - 'Date' column converted to datetime objects. Invalid dates were filtered out.
-    - Missing 'Engagements' values filled with 0.
-    - Column names normalized (e.g., 'Media Type' became 'mediatype').
-    """)
-
-    original_rows = len(df)
-    st.info(f"Original number of rows: {original_rows}")
-
-    # Normalize column names
-    df.columns = [normalize_column_name(col) for col in df.columns]
-
-    # Ensure all required columns are present
-    expected_columns = ['date', 'platform', 'sentiment', 'location', 'engagements', 'mediatype']
-    missing_columns = [col for col in expected_columns if col not in df.columns]
-    if missing_columns:
-        st.error(f"Error: Missing required columns in CSV: {', '.join(missing_columns)}. Please ensure your CSV has 'Date', 'Platform', 'Sentiment', 'Location', 'Engagements', 'Media Type' columns.")
-        st.stop() # Stop execution if critical columns are missing
-
-    # Convert 'date' to datetime, handling errors
-    df['date'] = pd.to_datetime(df['date'], errors='coerce')
-    df.dropna(subset=['date'], inplace=True) # Drop rows where date conversion failed
-    rows_after_date_clean = len(df)
-    if rows_after_date_clean < original_rows:
-        st.warning(f"Removed {original_rows - rows_after_date_clean} rows due to invalid 'Date' formats.")
-
-    # Fill missing 'engagements' with 0 and convert to integer
-    df['engagements'] = pd.to_numeric(df['engagements'], errors='coerce').fillna(0).astype(int)
-
-    st.success(f"Successfully processed {len(df)} rows of data after cleaning.")
-    return df
-
-def get_gemini_insight(prompt_text):
-    """Fetches insights from the Gemini API."""
-    if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY":
-        return "Gemini API key is not configured. Please set your API key to generate insights."
-
-    headers = {
-        'Content-Type': 'application/json'
-    }
-    payload = {
-        "contents": [
-            {
-                "role": "user",
-                "parts": [
-                    {"text": prompt_text}
-                ]
-            }
-        ]
-    }
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}"
-
-    try:
-        response = requests.post(api_url, headers=headers, data=json.dumps(payload))
-        response.raise_for_status() # Raise an exception for HTTP errors
-        result = response.json()
-
-        if result and result.get('candidates'):
-            first_candidate = result['candidates'][0]
-            if first_candidate.get('content') and first_candidate['content'].get('parts'):
-                return first_candidate['content']['parts'][0]['text']
-        return "Could not generate insights for this chart."
-    except requests.exceptions.RequestException as e:
-        return f"Error calling Gemini API: {e}. Check your API key and network."
-    except Exception as e:
-        return f"An unexpected error occurred: {e}"
-
-# --- Streamlit App ---
-
-st.title("Interactive Media Intelligence Dashboard")
-st.markdown("Gain insights from your media data with interactive charts.")
-
-st.markdown("""
+if st.secrets.load_if_toml_exists(): # st.secrets.get() reports an error when there's no secrets file
+    GEMINI_API_KEY = st.secrets.get("GEMINI_API_KEY", GEMINI_API_KEY)
+# Checked once here, so no insight prompts are built when there is no key to send them with
+GEMINI_API_KEY_OK = bool(GEMINI_API_KEY) and GEMINI_API_KEY != "YOUR_GEMINI_API_KEY"
+
+# Gemini calls give up after GEMINI_TIMEOUT (connect, read) seconds. After
+# GEMINI_FAILURE_THRESHOLD consecutive failed calls, calls are skipped for
+# GEMINI_COOLDOWN_SECONDS rather than waiting on a failing upstream again.
+GEMINI_TIMEOUT = (3, 15)
+GEMINI_FAILURE_THRESHOLD = 3
+GEMINI_COOLDOWN_SECONDS = 60
+
+# Generated insights are stored here, keyed on a hash of the prompt, so an
+# unchanged dataset doesn't hit the Gemini API again on every rerun.
+GEMINI_CACHE_PATH = "gemini_cache.sqlite3"
+
+# Columns (normalized names) every uploaded CSV must contain
+REQUIRED_COLUMNS = frozenset(['date', 'platform', 'sentiment', 'location', 'engagements', 'mediatype'])
+
+# Text label columns (normalized names) that are read as Arrow strings and stored as categoricals
+CATEGORY_COLUMNS = ('sentiment', 'platform', 'mediatype', 'location')
+
+# Translation table that strips the separators removed when normalizing column names
+COLUMN_NAME_SEPARATORS = str.maketrans('', '', ' -_')
+
+# Uploads larger than this are streamed in chunks of CSV_CHUNK_ROWS rows and
+# aggregated incrementally, so the full DataFrame is never held in memory
+LARGE_UPLOAD_BYTES = 50 * 1024 * 1024
+CSV_CHUNK_ROWS = 200_000
+
+# Page styles injected on every run; Streamlit removes any element a rerun doesn't redraw
+APP_CSS = """
 <style>
     .stApp {
         background-color: #e0f2fe; /* light blue-50 */
@@ -138,43 +84,148 @@ st.markdown("""
         padding: 1rem;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
-st.header("1. Upload Your CSV File")
-st.markdown("""
-Please upload a CSV file with the following columns:
-`<code style="background-color:#e2e8f0; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-family: monospace;">Date</code>`,
-`<code style="background-color:#e2e8f0; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-family: monospace;">Platform</code>`,
-`<code style="background-color:#e2e8f0; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-family: monospace;">Sentiment</code>`,
-`<code style="background-color:#e2e8f0; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-family: monospace;">Location</code>`,
-`<code style="background-color:#e2e8f0; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-family: monospace;">Engagements</code>`,
-`<code style="background-color:#e2e8f0; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-family: monospace;">Media Type</code>`.
-""", unsafe_allow_html=True)
+# --- Page Configuration ---
+st.set_page_config(
+    page_title="Interactive Media Intelligence Dashboard",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
 
+# --- Custom Functions ---
 
-uploaded_file = st.file_uploader("", type=["csv"], key="csv_uploader")
+@lru_cache(maxsize=64)
+def normalize_column_name(name):
+    """Normalizes column names by converting to lowercase and removing non-alphanumeric characters."""
+    return name.lower().translate(COLUMN_NAME_SEPARATORS)
 
-df = None
-if uploaded_file is not None:
-    with st.spinner("Processing data..."):
-        try:
-            # Read CSV directly from uploaded file buffer
-            df = pd.read_csv(uploaded_file)
-            df = clean_data(df.copy()) # Pass a copy to avoid modifying original
-            st.success("CSV file uploaded and data cleaned successfully!")
+def detect_date_format(dates):
+    """
+    Picks the format for parsing the 'date' column from a sample of its values: 'ISO8601'
+    (vectorized fast path) when it parses the sample as well as per-element 'mixed' parsing does,
+    otherwise 'mixed'.
+    """
+    sample = dates.dropna().astype(str).head(100)
+    iso_parsed = pd.to_datetime(sample, format='ISO8601', errors='coerce').notna().sum()
+    mixed_parsed = pd.to_datetime(sample, format='mixed', errors='coerce').notna().sum()
+    return 'ISO8601' if iso_parsed >= mixed_parsed else 'mixed'
 
-        except Exception as e:
-            st.error(f"Error reading or cleaning CSV: {e}")
-            df = None # Reset df to None on error
+def clean_data(df):
+    """
+    Cleans the input DataFrame:
+    - Converts 'date' column to datetime.
+    - Fills missing 'engagements' with 0.
+    - Normalizes all column names.
+    - Filters out rows with invalid dates.
+    - Stores the sentiment, platform, media type and location labels as categoricals.
+    Returns the cleaned DataFrame and a dict of row counts for the cleaning summary.
+    """
+    stats = {'original_rows': len(df)}
 
-if df is not None and not df.empty:
-    st.header("3. Interactive Charts")
+    # Normalize column names
+    df.columns = df.columns.str.lower().str.translate(COLUMN_NAME_SEPARATORS) # Same as normalize_column_name, vectorized over the Index
 
-    # Chart 1: Sentiment Breakdown (Pie Chart)
-    st.subheader("Sentiment Breakdown")
-    sentiment_counts = df['sentiment'].value_counts().reset_index()
+    # Ensure all required columns are present
+    missing_columns = REQUIRED_COLUMNS.difference(df.columns)
+    if missing_columns:
+        raise ValueError(f"Missing required columns in CSV: {', '.join(sorted(missing_columns))}. Please ensure your CSV has 'Date', 'Platform', 'Sentiment', 'Location', 'Engagements', 'Media Type' columns.")
+
+    # Convert 'date' to datetime, handling errors
+    df['date'] = pd.to_datetime(df['date'], errors='coerce', format=detect_date_format(df['date']))
+    df.dropna(subset=['date'], inplace=True) # Drop rows where date conversion failed
+    stats['rows_after_date_clean'] = len(df)
+
+    # Fill missing 'engagements' with 0 and convert to the smallest integer type that fits
+    # (sums are still accumulated in 64 bits)
+    engagements = pd.to_numeric(df['engagements'], errors='coerce').fillna(0).astype(int)
+    df['engagements'] = pd.to_numeric(engagements, downcast='integer')
+
+    # Store the repeated labels as categoricals so counting and grouping work on integer codes
+    for col in CATEGORY_COLUMNS:
+        df[col] = df[col].astype('category')
+
+    return df, stats
+
+def aggregate_chunk(df):
+    """Computes the partial data behind each chart for one cleaned chunk of rows."""
+    return {
+        'sentiment': df['sentiment'].value_counts(),
+        'engagement': df.resample('D', on='date')['engagements'].sum(),
+        'platform': df.groupby('platform', observed=True)['engagements'].sum(),
+        'mediatype': df['mediatype'].value_counts(),
+        'location': df.groupby('location', observed=True)['engagements'].sum(),
+    }
+
+def combine_chart_data(partials):
+    """
+    Combines the per-chunk partials from aggregate_chunk into the data behind each chart:
+    sentiment counts, daily engagement trend, engagements per platform,
+    media type counts and the top 5 locations by engagements.
+    """
+    def combine(name):
+        return pd.concat([partial[name] for partial in partials]).groupby(level=0, observed=True).sum()
+
+    sentiment_counts = combine('sentiment').sort_values(ascending=False).reset_index()
     sentiment_counts.columns = ['Sentiment', 'Count']
-    fig_sentiment = px.pie(
+    engagement_trend = pd.concat([partial['engagement'] for partial in partials]).resample('D').sum().reset_index() # Plotly plots datetime64 directly
+    platform_engagements = combine('platform').reset_index()
+    platform_engagements = platform_engagements.sort_values('engagements', ascending=False)
+    mediatype_counts = combine('mediatype').sort_values(ascending=False).reset_index()
+    mediatype_counts.columns = ['MediaType', 'Count']
+    location_engagements = combine('location').nlargest(5).reset_index() # Partial selection, no full sort
+    return sentiment_counts, engagement_trend, platform_engagements, mediatype_counts, location_engagements
+
+@st.cache_data(show_spinner=False, ttl=24*60*60)
+def load_and_aggregate(file_bytes):
+    """
+    Reads, cleans and aggregates the uploaded CSV, returning the chart data and the cleaning stats.
+    Cached on the raw file bytes so that widget interactions rerun the script without reparsing the file.
+    """
+    # Map the label columns to Arrow strings by their raw header names, so the
+    # parser doesn't have to build Python string objects
+    header = pd.read_csv(io.BytesIO(file_bytes), nrows=0).columns
+    label_dtypes = {col: 'string[pyarrow]' for col in header if normalize_column_name(col) in CATEGORY_COLUMNS}
+
+    if len(file_bytes) > LARGE_UPLOAD_BYTES:
+        chunks = pd.read_csv(io.BytesIO(file_bytes), dtype=label_dtypes, chunksize=CSV_CHUNK_ROWS)
+    else:
+        # The multithreaded pyarrow parser is faster, but it can't read in chunks
+        chunks = [pd.read_csv(io.BytesIO(file_bytes), engine='pyarrow', dtype=label_dtypes)]
+
+    partials = []
+    stats = {'original_rows': 0, 'rows_after_date_clean': 0}
+    for chunk in chunks:
+        chunk, chunk_stats = clean_data(chunk)
+        partials.append(aggregate_chunk(chunk))
+        for key in stats:
+            stats[key] += chunk_stats[key]
+    return combine_chart_data(partials), stats
+
+def report_cleaning(stats):
+    """Renders the data cleaning summary from the stats returned by clean_data."""
+    st.subheader("2. Data Cleaning Summary")
+    st.markdown("""
+    - 'Date' column converted to datetime objects. Invalid dates were filtered out.
+    - Missing 'Engagements' values filled with 0.
+    - Column names normalized (e.g., 'Media Type' became 'mediatype').
+    """)
+
+    original_rows = stats['original_rows']
+    st.info(f"Original number of rows: {original_rows}")
+
+    rows_after_date_clean = stats['rows_after_date_clean']
+    if rows_after_date_clean < original_rows:
+        st.warning(f"Removed {original_rows - rows_after_date_clean} rows due to invalid 'Date' formats.")
+
+    st.success(f"Successfully processed {rows_after_date_clean} rows of data after cleaning.")
+
+# The chart figures are cached on their aggregated data, so reruns on an
+# unchanged dataset reuse the built figures instead of rebuilding them
+@st.cache_resource(show_spinner=False, ttl=24*60*60)
+def build_sentiment_fig(sentiment_counts):
+    """Builds the Sentiment Breakdown pie chart."""
+    fig = px.pie(
         sentiment_counts,
         values='Count',
         names='Sentiment',
@@ -182,7 +233,7 @@ if df is not None and not df.empty:
         hole=0.4,
         color_discrete_sequence=px.colors.qualitative.Pastel
     )
-    fig_sentiment.update_layout(
+    fig.update_layout(
         title_font_size=24,
         legend_orientation="h",
         legend_yanchor="bottom",
@@ -191,70 +242,49 @@ if df is not None and not df.empty:
         legend_x=0.5,
         height=400
     )
-    st.plotly_chart(fig_sentiment, use_container_width=True)
+    return fig
 
-    with st.spinner("Generating insights for Sentiment Breakdown..."):
-        prompt_sentiment = f"Given the following sentiment distribution from a media dataset: {sentiment_counts.to_dict('records')}. Provide 3 key insights about the overall sentiment. Focus on the most prevalent sentiments and any notable imbalances. Present insights as plain text, without any markdown formatting like bolding or bullet points. Use bullet points for readability. Also mention the dominant sentiment and why it is important"
-        insights_sentiment = get_gemini_insight(prompt_sentiment)
-        st.markdown(f"**Top 3 Insights (Sentiment Breakdown):**\n\n{insights_sentiment}")
-        st.markdown("---")
-
-    # Chart 2: Engagement Trend over time (Line Chart)
-    st.subheader("Engagement Trend Over Time")
-    engagement_trend = df.groupby(df['date'].dt.to_period('D'))['engagements'].sum().reset_index()
-    engagement_trend['date'] = engagement_trend['date'].astype(str) # Convert Period to string for Plotly
-    fig_engagement = px.line(
+@st.cache_resource(show_spinner=False, ttl=24*60*60)
+def build_engagement_fig(engagement_trend):
+    """Builds the Engagement Trend Over Time line chart."""
+    fig = px.line(
         engagement_trend,
         x='date',
         y='engagements',
         title='Engagement Trend Over Time',
         markers=True
     )
-    fig_engagement.update_layout(
+    fig.update_layout(
         title_font_size=24,
         xaxis_title="Date",
         yaxis_title="Total Engagements",
         xaxis_rangeslider_visible=True, # Add range slider
         height=400
     )
-    st.plotly_chart(fig_engagement, use_container_width=True)
+    return fig
 
-    with st.spinner("Generating insights for Engagement Trend..."):
-        prompt_engagement = f"Analyze the following engagement data over time: {engagement_trend.to_dict('records')}. Describe the trend of engagements over the period. Are there any peaks, troughs, or consistent patterns? Give 3 key insights. Present insights as plain text, without any markdown formatting like bolding or bullet points. Use bullet points for readability. Highlight any significant spikes or drops in engagement"
-        insights_engagement = get_gemini_insight(prompt_engagement)
-        st.markdown(f"**Top 3 Insights (Engagement Trend):**\n\n{insights_engagement}")
-        st.markdown("---")
-
-    # Chart 3: Platform Engagements (Bar Chart)
-    st.subheader("Platform Engagements")
-    platform_engagements = df.groupby('platform')['engagements'].sum().reset_index()
-    platform_engagements = platform_engagements.sort_values('engagements', ascending=False)
-    fig_platform = px.bar(
+@st.cache_resource(show_spinner=False, ttl=24*60*60)
+def build_platform_fig(platform_engagements):
+    """Builds the Platform Engagements bar chart."""
+    fig = px.bar(
         platform_engagements,
         x='platform',
         y='engagements',
         title='Platform Engagements',
         color='platform'
     )
-    fig_platform.update_layout(
+    fig.update_layout(
         title_font_size=24,
         xaxis_title="Platform",
         yaxis_title="Total Engagements",
         height=400
     )
-    st.plotly_chart(fig_platform, use_container_width=True)
+    return fig
 
-    with st.spinner("Generating insights for Platform Engagements..."):
-        prompt_platform = f"Based on the total engagements per platform: {platform_engagements.to_dict('records')}. What are the top platforms driving engagements? Are there any platforms significantly underperforming? Provide 3 key insights. Present insights as plain text, without any markdown formatting like bolding or bullet points. Use bullet points for readability. Identify top performing platforms"
-        insights_platform = get_gemini_insight(prompt_platform)
-        st.markdown(f"**Top 3 Insights (Platform Engagements):**\n\n{insights_platform}")
-        st.markdown("---")
-
-    # Chart 4: Media Type Mix (Pie Chart)
-    st.subheader("Media Type Mix")
-    mediatype_counts = df['mediatype'].value_counts().reset_index()
-    mediatype_counts.columns = ['MediaType', 'Count']
-    fig_mediatype = px.pie(
+@st.cache_resource(show_spinner=False, ttl=24*60*60)
+def build_mediatype_fig(mediatype_counts):
+    """Builds the Media Type Mix pie chart."""
+    fig = px.pie(
         mediatype_counts,
         values='Count',
         names='MediaType',
@@ -262,7 +292,7 @@ if df is not None and not df.empty:
         hole=0.4,
         color_discrete_sequence=px.colors.qualitative.Set2
     )
-    fig_mediatype.update_layout(
+    fig.update_layout(
         title_font_size=24,
         legend_orientation="h",
         legend_yanchor="bottom",
@@ -271,38 +301,253 @@ if df is not None and not df.empty:
         legend_x=0.5,
         height=400
     )
-    st.plotly_chart(fig_mediatype, use_container_width=True)
+    return fig
 
-    with st.spinner("Generating insights for Media Type Mix..."):
-        prompt_mediatype = f"Given the distribution of media types: {mediatype_counts.to_dict('records')}. What are the most common media types used? Is there a significant preference for certain types? Give 3 key insights. Present insights as plain text, without any markdown formatting like bolding or bullet points. Use bullet points for readability. Discuss the most prevalent media type"
-        insights_mediatype = get_gemini_insight(prompt_mediatype)
-        st.markdown(f"**Top 3 Insights (Media Type Mix):**\n\n{insights_mediatype}")
-        st.markdown("---")
-
-    # Chart 5: Top 5 Locations (Bar Chart)
-    st.subheader("Top 5 Locations by Engagements")
-    location_engagements = df.groupby('location')['engagements'].sum().reset_index()
-    location_engagements = location_engagements.sort_values('engagements', ascending=False).head(5)
-    fig_location = px.bar(
+@st.cache_resource(show_spinner=False, ttl=24*60*60)
+def build_location_fig(location_engagements):
+    """Builds the Top 5 Locations by Engagements bar chart."""
+    fig = px.bar(
         location_engagements,
         x='location',
         y='engagements',
         title='Top 5 Locations by Engagements',
         color='location'
     )
-    fig_location.update_layout(
+    fig.update_layout(
         title_font_size=24,
         xaxis_title="Location",
         yaxis_title="Total Engagements",
         height=400
     )
-    st.plotly_chart(fig_location, use_container_width=True)
+    return fig
 
-    with st.spinner("Generating insights for Top 5 Locations..."):
-        prompt_location = f"Here are the top 5 locations by engagements: {location_engagements.to_dict('records')}. What does this data tell us about geographical engagement? Are there specific regions that are highly active? Provide 3 key insights. Present insights as plain text, without any markdown formatting like bolding or bullet points. Use bullet points for readability. Point out the most engaged locations"
-        insights_location = get_gemini_insight(prompt_location)
-        st.markdown(f"**Top 3 Insights (Top 5 Locations):**\n\n{insights_location}")
+@st.experimental_fragment
+def render_chart_section(title, insight_title, fig, insight_stream):
+    """
+    Renders one chart with its Gemini insights. Runs as a fragment, so an
+    interaction inside one chart reruns only that section, not the whole script.
+    insight_stream is the (future, chunks queue) pair of the insight's worker, or
+    None when the API key isn't configured. Insights still being fetched are
+    streamed from the queue as they arrive.
+    """
+    st.subheader(title)
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.markdown(f"**Top 3 Insights ({insight_title}):**")
+    if insight_stream is None:
+        st.markdown("Gemini API key is not configured. Please set your API key to generate insights.")
         st.markdown("---")
+        return
+
+    insight_future, insight_chunks = insight_stream
+    if insight_future.done():
+        # Already complete (cached answer, or a fragment rerun after the queue was drained)
+        st.markdown(insight_future.result())
+    else:
+        with st.spinner(f"Generating insights for {insight_title}..."):
+            st.write_stream(iter(insight_chunks.get, None))
+    st.markdown("---")
+
+def insight_cache_get(key):
+    """Returns the cached insight for key, or None on a miss."""
+    try:
+        with closing(sqlite3.connect(GEMINI_CACHE_PATH)) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache(k BLOB PRIMARY KEY, v TEXT)")
+            row = conn.execute("SELECT v FROM cache WHERE k = ?", (key,)).fetchone()
+    except sqlite3.Error:
+        return None # An unusable cache just means calling the API
+    return row[0] if row else None
+
+def insight_cache_set(key, value):
+    """Stores an insight under key, replacing any previous value."""
+    try:
+        with closing(sqlite3.connect(GEMINI_CACHE_PATH)) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache(k BLOB PRIMARY KEY, v TEXT)")
+            conn.execute("INSERT OR REPLACE INTO cache(k, v) VALUES (?, ?)", (key, value))
+    except sqlite3.Error:
+        pass
+
+@st.cache_resource
+def get_http_session():
+    """
+    Returns the requests.Session shared by all Gemini calls. Streamlit re-executes the
+    script on every rerun, so the session is kept as a cached resource to reuse its
+    keep-alive connections (and TLS handshakes) across calls and reruns.
+    Call it from the script thread; the insight worker threads have no Streamlit context.
+    """
+    session = requests.Session()
+    session.headers.update({'Content-Type': 'application/json'})
+    # Retry transient errors with exponential backoff; POST must be allowed explicitly
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['POST'])
+    session.mount('https://', HTTPAdapter(max_retries=retry, pool_connections=10, pool_maxsize=10))
+    return session
+
+@st.cache_resource
+def get_gemini_circuit_breaker():
+    """
+    Returns the failure state shared by all Gemini calls. It's kept process-wide rather
+    than per session, since an upstream outage affects every user alike.
+    Call it from the script thread, like get_http_session.
+    """
+    return {'lock': threading.Lock(), 'failures': 0, 'open_until': 0.0}
+
+def gemini_circuit_is_open(breaker):
+    """Returns True while calls are being skipped after repeated failures."""
+    with breaker['lock']:
+        return time.monotonic() < breaker['open_until']
+
+def record_gemini_call(breaker, succeeded):
+    """Resets the failure count after a success, and opens the breaker after too many consecutive failures."""
+    with breaker['lock']:
+        if succeeded:
+            breaker['failures'] = 0
+            return
+        breaker['failures'] += 1
+        if breaker['failures'] >= GEMINI_FAILURE_THRESHOLD:
+            breaker['open_until'] = time.monotonic() + GEMINI_COOLDOWN_SECONDS
+            breaker['failures'] = 0
+
+def stream_gemini_insight(prompt_text, session, breaker):
+    """
+    Streams insights from the Gemini API over the given requests.Session, yielding
+    the text as it arrives. Answers for prompts seen before are yielded whole from the cache.
+    The call is skipped while the circuit breaker is open, and its outcome is recorded in it.
+    Only called when GEMINI_API_KEY_OK.
+    """
+    cache_key = hashlib.sha256(prompt_text.encode()).digest()
+    cached_insight = insight_cache_get(cache_key)
+    if cached_insight is not None:
+        yield cached_insight
+        return
+
+    if gemini_circuit_is_open(breaker):
+        yield "Gemini API is temporarily unavailable after repeated errors. Insights will be retried in a minute."
+        return
+
+    payload = {
+        "contents": [
+            {
+                "role": "user",
+                "parts": [
+                    {"text": prompt_text}
+                ]
+            }
+        ]
+    }
+    # alt=sse makes Gemini send each partial response as a 'data: {...}' server-sent event line
+    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:streamGenerateContent?alt=sse&key={GEMINI_API_KEY}"
+
+    try:
+        with session.post(api_url, data=json.dumps(payload, separators=(',', ':')).encode(), stream=True, timeout=GEMINI_TIMEOUT) as response: # Compact UTF-8 body
+            response.raise_for_status() # Raise an exception for HTTP errors
+            insight_parts = []
+            for line in response.iter_lines():
+                if not line.startswith(b'data: '):
+                    continue
+                result = json.loads(line[len(b'data: '):])
+                if result and result.get('candidates'):
+                    first_candidate = result['candidates'][0]
+                    if first_candidate.get('content') and first_candidate['content'].get('parts'):
+                        text = first_candidate['content']['parts'][0].get('text', '')
+                        insight_parts.append(text)
+                        yield text
+        record_gemini_call(breaker, succeeded=True)
+
+        if insight_parts:
+            insight_cache_set(cache_key, ''.join(insight_parts)) # Only complete answers are cached
+        else:
+            yield "Could not generate insights for this chart."
+    except requests.exceptions.RequestException as e:
+        record_gemini_call(breaker, succeeded=False)
+        yield f"Error calling Gemini API: {e}. Check your API key and network."
+    except Exception as e:
+        yield f"An unexpected error occurred: {e}"
+
+def fetch_insight(prompt_text, session, breaker, insight_chunks):
+    """
+    Runs in an insight worker thread: puts each streamed piece of the insight on the
+    insight_chunks queue, followed by None, and returns the full text.
+    """
+    insight_parts = []
+    for text in stream_gemini_insight(prompt_text, session, breaker):
+        insight_parts.append(text)
+        insight_chunks.put(text)
+    insight_chunks.put(None)
+    return ''.join(insight_parts)
+
+# --- Streamlit App ---
+
+st.title("Interactive Media Intelligence Dashboard")
+st.markdown("Gain insights from your media data with interactive charts.")
+
+st.markdown(APP_CSS, unsafe_allow_html=True)
+
+st.header("1. Upload Your CSV File")
+st.markdown("""
+Please upload a CSV file with the following columns:
+`<code style="background-color:#e2e8f0; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-family: monospace;">Date</code>`,
+`<code style="background-color:#e2e8f0; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-family: monospace;">Platform</code>`,
+`<code style="background-color:#e2e8f0; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-family: monospace;">Sentiment</code>`,
+`<code style="background-color:#e2e8f0; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-family: monospace;">Location</code>`,
+`<code style="background-color:#e2e8f0; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-family: monospace;">Engagements</code>`,
+`<code style="background-color:#e2e8f0; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-family: monospace;">Media Type</code>`.
+""", unsafe_allow_html=True)
+
+
+uploaded_file = st.file_uploader("", type=["csv"], key="csv_uploader")
+
+chart_data = None
+if uploaded_file is not None:
+    with st.spinner("Processing data..."):
+        try:
+            # Read, clean and aggregate the CSV, reusing the cached result on reruns
+            chart_data, cleaning_stats = load_and_aggregate(uploaded_file.getvalue())
+            report_cleaning(cleaning_stats)
+            st.success("CSV file uploaded and data cleaned successfully!")
+
+        except Exception as e:
+            st.error(f"Error reading or cleaning CSV: {e}")
+            chart_data = None # Reset chart_data to None on error
+
+if chart_data is not None and cleaning_stats['rows_after_date_clean'] > 0:
+    st.header("3. Interactive Charts")
+
+    # The data for every chart is aggregated up front, so all insight prompts are known before rendering
+    sentiment_counts, engagement_trend, platform_engagements, mediatype_counts, location_engagements = chart_data
+
+    insight_streams = {}
+    if GEMINI_API_KEY_OK:
+        # The Gemini calls are network-bound, so issue them in parallel; each chart
+        # section streams its insight from the queue its worker fills
+        insight_prompts = {
+            'sentiment': f"Given the following sentiment distribution from a media dataset (CSV):\n{sentiment_counts.to_csv(index=False)}Provide 3 key insights about the overall sentiment. Focus on the most prevalent sentiments and any notable imbalances. Present insights as plain text, without any markdown formatting like bolding or bullet points. Use bullet points for readability. Also mention the dominant sentiment and why it is important",
+            'engagement': f"Analyze the following engagement data over time (CSV):\n{engagement_trend.to_csv(index=False)}Describe the trend of engagements over the period. Are there any peaks, troughs, or consistent patterns? Give 3 key insights. Present insights as plain text, without any markdown formatting like bolding or bullet points. Use bullet points for readability. Highlight any significant spikes or drops in engagement",
+            'platform': f"Based on the total engagements per platform (CSV):\n{platform_engagements.to_csv(index=False)}What are the top platforms driving engagements? Are there any platforms significantly underperforming? Provide 3 key insights. Present insights as plain text, without any markdown formatting like bolding or bullet points. Use bullet points for readability. Identify top performing platforms",
+            'mediatype': f"Given the distribution of media types (CSV):\n{mediatype_counts.to_csv(index=False)}What are the most common media types used? Is there a significant preference for certain types? Give 3 key insights. Present insights as plain text, without any markdown formatting like bolding or bullet points. Use bullet points for readability. Discuss the most prevalent media type",
+            'location': f"Here are the top 5 locations by engagements (CSV):\n{location_engagements.to_csv(index=False)}What does this data tell us about geographical engagement? Are there specific regions that are highly active? Provide 3 key insights. Present insights as plain text, without any markdown formatting like bolding or bullet points. Use bullet points for readability. Point out the most engaged locations",
+        }
+        insight_executor = ThreadPoolExecutor(max_workers=len(insight_prompts))
+        http_session = get_http_session()
+        gemini_breaker = get_gemini_circuit_breaker()
+        for name, prompt in insight_prompts.items():
+            insight_chunks = queue.Queue()
+            insight_streams[name] = (insight_executor.submit(fetch_insight, prompt, http_session, gemini_breaker, insight_chunks), insight_chunks)
+        insight_executor.shutdown(wait=False) # Queued calls keep running; results are read below
+
+    # Chart 1: Sentiment Breakdown (Pie Chart)
+    render_chart_section("Sentiment Breakdown", "Sentiment Breakdown", build_sentiment_fig(sentiment_counts), insight_streams.get('sentiment'))
+
+    # Chart 2: Engagement Trend over time (Line Chart)
+    render_chart_section("Engagement Trend Over Time", "Engagement Trend", build_engagement_fig(engagement_trend), insight_streams.get('engagement'))
+
+    # Chart 3: Platform Engagements (Bar Chart)
+    render_chart_section("Platform Engagements", "Platform Engagements", build_platform_fig(platform_engagements), insight_streams.get('platform'))
+
+    # Chart 4: Media Type Mix (Pie Chart)
+    render_chart_section("Media Type Mix", "Media Type Mix", build_mediatype_fig(mediatype_counts), insight_streams.get('mediatype'))
+
+    # Chart 5: Top 5 Locations (Bar Chart)
+    render_chart_section("Top 5 Locations by Engagements", "Top 5 Locations", build_location_fig(location_engagements), insight_streams.get('location'))
 
 st.markdown("""
 <div style="background-color: #bfdbfe; padding: 1.5rem; border-radius: 0.75rem; text-align: center; margin-top: 2rem;">